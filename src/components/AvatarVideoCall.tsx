@@ -4,12 +4,16 @@ import { Button } from '@/components/ui/button';
 import { useToast } from '@/hooks/use-toast';
 import { SimliAvatarClient } from '@/utils/SimliClient';
 import { RealtimeChat, AudioSettings } from '@/utils/RealtimeAudio';
+import { FunctionsHttpError } from '@supabase/supabase-js';
 import { supabase } from '@/integrations/supabase/client';
 import { useNetworkQuality, getOptimalAudioSettings, NetworkQuality } from '@/hooks/useNetworkQuality';
 
 // Default Simli Face ID - you can change this to any face from Simli's library
 const SIMLI_FACE_ID = 'cace3ef7-a4c4-425d-a8cf-a5358eb0c427';
 
+// Must match MAX_MESSAGE_LENGTH in the ai-chat edge function
+const MAX_MESSAGE_LENGTH = 4000;
+
 interface Message {
   id: number;
   sender: 'user' | 'agent';
@@ -614,6 +618,16 @@ export const AvatarVideoCall = () => {
 
     const userMessage = inputText.trim();
     const fileToSend = uploadedFile;
+
+    // Check before clearing the input so an over-long message isn't lost
+    if (userMessage.length > MAX_MESSAGE_LENGTH) {
+      toast({
+        variant: 'destructive',
+        title: 'Message too long',
+        description: `Please keep messages under ${MAX_MESSAGE_LENGTH} characters`,
+      });
+      return;
+    }
     
     setInputText('');
     setUploadedFile(null);
@@ -645,10 +659,18 @@ export const AvatarVideoCall = () => {
 
     } catch (error) {
       console.error('Error processing message:', error);
+
+      // Prefer the function's own error text (e.g. rate limit, validation)
+      let description = 'Failed to process your request. Please try again.';
+      if (error instanceof FunctionsHttpError) {
+        const body = await error.context.json().catch(() => null);
+        if (typeof body?.error === 'string') description = body.error;
+      }
+
       toast({
         variant: 'destructive',
         title: 'Error',
-        description: 'Failed to process your request. Please try again.',
+        description,
       });
     }
   }, [status, inputText, uploadedFile, toast]);
@@ -934,6 +956,7 @@ export const AvatarVideoCall = () => {
                   value={inputText}
                   onChange={(e) => setInputText(e.target.value)}
                   onKeyDown={(e) => e.key === 'Enter' && sendMessageWithFile()}
+                  maxLength={MAX_MESSAGE_LENGTH}
                   placeholder={uploadedFile ? 'Ask about the file...' : (status === 'connected' ? 'Or type a message...' : 'Connect to send messages')}
                   disabled={status !== 'connected'}
                   className="flex-1 bg-transparent text-sm text-foreground placeholder:text-muted-foreground focus:outline-none disabled:opacity-50"
@@ -10,6 +10,16 @@ interface DIDClientCallbacks {
   onMessage?: (text: string) => void;
 }
 
+interface IceCandidatePayload {
+  candidate: string;
+  sdpMid: string | null;
+  sdpMLineIndex: number | null;
+}
+
+// Max time a candidate waits in the buffer, and max candidates per request
+const ICE_BATCH_WINDOW_MS = 20;
+const ICE_BATCH_MAX = 16;
+
 export class DIDClient {
   private callbacks: DIDClientCallbacks;
   private peerConnection: RTCPeerConnection | null = null;
@@ -22,6 +32,10 @@ export class DIDClient {
   private speakQueue: string[] = [];
   private isProcessingQueue = false;
   private speechDisabledReason: string | null = null;
+  // Trickled ICE candidates are buffered briefly and sent in one request
+  private pendingIceCandidates: IceCandidatePayload[] = [];
+  private iceFlushTimer: ReturnType<typeof setTimeout> | null = null;
+  private inFlightIceSubmissions = new Set<Promise<unknown>>();
 
   constructor(agentId: string, callbacks: DIDClientCallbacks) {
     this.agentId = agentId;
@@ -117,31 +131,22 @@ export class DIDClient {
 
 
       // Handle ICE candidates
-      this.peerConnection.onicecandidate = async (event) => {
+      this.peerConnection.onicecandidate = (event) => {
         if (event.candidate) {
-          console.log('Sending ICE candidate');
-          await supabase.functions.invoke('did-stream', {
-            body: {
-              action: 'submit-ice',
-              agentId: this.agentId,
-              streamId: this.streamId,
-              sessionId: this.sessionId,
-              candidate: event.candidate.candidate,
-              sdpMid: event.candidate.sdpMid,
-              sdpMLineIndex: event.candidate.sdpMLineIndex,
-            }
+          this.pendingIceCandidates.push({
+            candidate: event.candidate.candidate,
+            sdpMid: event.candidate.sdpMid,
+            sdpMLineIndex: event.candidate.sdpMLineIndex,
           });
+          if (this.pendingIceCandidates.length >= ICE_BATCH_MAX) {
+            this.flushIceCandidates(false);
+          } else if (!this.iceFlushTimer) {
+            this.iceFlushTimer = setTimeout(() => this.flushIceCandidates(false), ICE_BATCH_WINDOW_MS);
+          }
         } else {
           // End of ICE gathering
           console.log('ICE gathering complete');
-          await supabase.functions.invoke('did-stream', {
-            body: {
-              action: 'submit-ice',
-              agentId: this.agentId,
-              streamId: this.streamId,
-              sessionId: this.sessionId,
-            }
-          });
+          this.flushIceCandidates(true);
         }
       };
 
@@ -195,6 +200,46 @@ export class DIDClient {
     }
   }
 
+  private flushIceCandidates(endOfCandidates: boolean): void {
+    if (this.iceFlushTimer) {
+      clearTimeout(this.iceFlushTimer);
+      this.iceFlushTimer = null;
+    }
+
+    const candidates = this.pendingIceCandidates;
+    this.pendingIceCandidates = [];
+
+    // Candidate batches go out immediately and run concurrently
+    if (candidates.length > 0) {
+      console.log('Sending', candidates.length, 'ICE candidate(s)');
+      const submission = this.submitIce({ candidates });
+      this.inFlightIceSubmissions.add(submission);
+      submission.finally(() => this.inFlightIceSubmissions.delete(submission));
+    }
+
+    // Only the end-of-candidates marker needs ordering: it waits for every
+    // batch still in flight so it can never overtake one
+    if (endOfCandidates) {
+      Promise.allSettled(this.inFlightIceSubmissions).then(() =>
+        this.submitIce({ candidates: [], endOfCandidates: true }),
+      );
+    }
+  }
+
+  private submitIce(payload: { candidates: IceCandidatePayload[]; endOfCandidates?: boolean }): Promise<unknown> {
+    return supabase.functions
+      .invoke('did-stream', {
+        body: {
+          action: 'submit-ice',
+          agentId: this.agentId,
+          streamId: this.streamId,
+          sessionId: this.sessionId,
+          ...payload,
+        },
+      })
+      .catch((error) => console.error('ICE submission error:', error));
+  }
+
   async speak(text: string): Promise<boolean> {
     if (!this.streamId || !this.sessionId) {
       console.error('Not connected');
@@ -326,6 +371,13 @@ export class DIDClient {
       }).catch(console.error);
     }
 
+    if (this.iceFlushTimer) {
+      clearTimeout(this.iceFlushTimer);
+      this.iceFlushTimer = null;
+    }
+    this.pendingIceCandidates = [];
+    this.inFlightIceSubmissions.clear();
+
     if (this.peerConnection) {
       this.peerConnection.close();
       this.peerConnection = null;
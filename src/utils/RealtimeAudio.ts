@@ -199,7 +199,10 @@ export class RealtimeChat {
 
       // Get ephemeral token from edge function with retry
       const { data, error } = await retryWithBackoff(
-        () => supabase.functions.invoke('realtime-session'),
+        // On reconnect, ask for a new token rather than the shared cached one
+        () => supabase.functions.invoke('realtime-session', {
+          body: { fresh: this.reconnectAttempts > 0 },
+        }),
         3,
         1000,
         5000
@@ -0,0 +1,33 @@
+// CORS headers shared by every edge function. Set ALLOWED_ORIGINS to a
+// comma-separated list of deploy origins to pin them; when unset, any origin
+// is allowed. Preflights are cacheable for a day so browsers skip the extra
+// OPTIONS round-trip on repeat calls.
+const ALLOWED_ORIGINS = (Deno.env.get('ALLOWED_ORIGINS') ?? '')
+  .split(',')
+  .map((origin) => origin.trim())
+  .filter(Boolean);
+
+const baseCorsHeaders = {
+  'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type',
+  'Access-Control-Allow-Methods': 'POST, OPTIONS',
+  'Access-Control-Max-Age': '86400',
+};
+
+const wildcardCorsHeaders: Record<string, string> = {
+  ...baseCorsHeaders,
+  'Access-Control-Allow-Origin': '*',
+};
+
+const pinnedCorsHeaders = new Map<string, Record<string, string>>(
+  ALLOWED_ORIGINS.map((origin) => [
+    origin,
+    { ...baseCorsHeaders, 'Access-Control-Allow-Origin': origin, 'Vary': 'Origin' },
+  ]),
+);
+
+const rejectedCorsHeaders: Record<string, string> = { ...baseCorsHeaders, 'Vary': 'Origin' };
+
+export const getCorsHeaders = (req: Request): Record<string, string> => {
+  if (ALLOWED_ORIGINS.length === 0) return wildcardCorsHeaders;
+  return pinnedCorsHeaders.get(req.headers.get('Origin') ?? '') ?? rejectedCorsHeaders;
+};
@@ -0,0 +1,31 @@
+// JSON responses carrying the caller's CORS headers. `rawJsonResponse` takes
+// an already-encoded body (text or an upstream stream) and forwards it as-is.
+export const rawJsonResponse = (
+  json: BodyInit | null,
+  corsHeaders: Record<string, string>,
+  status = 200,
+): Response =>
+  new Response(json, {
+    status,
+    headers: { ...corsHeaders, 'Content-Type': 'application/json' },
+  });
+
+export const jsonResponse = (
+  body: unknown,
+  corsHeaders: Record<string, string>,
+  status = 200,
+): Response => rawJsonResponse(JSON.stringify(body), corsHeaders, status);
+
+// Bodyless success for fire-and-forget calls whose result the client ignores
+export const noContentResponse = (corsHeaders: Record<string, string>): Response =>
+  new Response(null, { status: 204, headers: corsHeaders });
+
+// True when the declared Content-Length is over `maxBytes`, so oversized
+// payloads can be turned away with a 413 before the body is read or parsed
+export const exceedsBodyLimit = (req: Request, maxBytes: number): boolean =>
+  Number(req.headers.get('Content-Length') ?? 0) > maxBytes;
+
+// Status for an error caught in a handler: 504 when an upstream call hit its
+// AbortSignal.timeout, 500 otherwise
+export const errorStatus = (err: unknown): number =>
+  err instanceof DOMException && err.name === 'TimeoutError' ? 504 : 500;
@@ -0,0 +1,17 @@
+// Level-gated logging for the edge functions. Per-request traces go through
+// `log.debug` so production (LOG_LEVEL=info, the default) skips them entirely.
+const LEVELS = { debug: 10, info: 20, warn: 30, error: 40 } as const;
+
+type LogLevel = keyof typeof LEVELS;
+
+const threshold =
+  LEVELS[(Deno.env.get('LOG_LEVEL') ?? 'info').toLowerCase() as LogLevel] ?? LEVELS.info;
+
+const noop = (..._args: unknown[]) => {};
+
+export const log = {
+  debug: threshold <= LEVELS.debug ? console.debug.bind(console) : noop,
+  info: threshold <= LEVELS.info ? console.log.bind(console) : noop,
+  warn: threshold <= LEVELS.warn ? console.warn.bind(console) : noop,
+  error: console.error.bind(console),
+};
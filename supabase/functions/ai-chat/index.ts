@@ -1,30 +1,83 @@
-import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
+import { getCorsHeaders } from "../_shared/cors.ts";
+import { errorStatus, exceedsBodyLimit, jsonResponse } from "../_shared/http.ts";
+import { log } from "../_shared/log.ts";
 
-const corsHeaders = {
-  'Access-Control-Allow-Origin': '*',
-  'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type',
-};
+const LOVABLE_API_KEY = Deno.env.get('LOVABLE_API_KEY');
+
+// Uploads are capped at 10 MB in the client; base64 encoding grows that by a
+// third, plus room for the JSON wrapper
+const MAX_BODY_BYTES = 14 * 1024 * 1024;
+// Mirrored by the chat input in AvatarVideoCall
+const MAX_MESSAGE_LENGTH = 4000;
+// Image and document analysis can take a while, but not indefinitely
+const UPSTREAM_TIMEOUT_MS = 45_000;
+
+const ARIA_SYSTEM_PROMPT = `You are Aria, a friendly and helpful female AI IT Support Agent. You have a warm, sweet, and polite personality.
+
+Key behaviors:
+- Be helpful with any task the user asks - whether it's IT support, analyzing documents, solving exam questions, or any other request
+- When given documents, images, or files, carefully analyze them and help with whatever the user needs
+- If given an exam paper or worksheet, solve the questions step by step with clear explanations
+- Be concise but thorough when explaining solutions
+- Speak naturally like a real person, not like an AI
+- Be patient, understanding, and genuinely caring
+- Use friendly phrases like "I'd be happy to help!", "No worries!", "Let me help you with that"
+- Never mention that you are an AI avatar or any technical implementation details
+- Just be Aria - a friendly helpful assistant
+
+You can help with:
+- Analyzing documents, images, and files
+- Solving exam questions and homework problems
+- Explaining concepts and providing step-by-step solutions
+- IT support and troubleshooting
+- Any other tasks the user needs help with
+
+Always make users feel valued and heard.`;
+
+// The model and system prompt are fixed, so the leading part of the request
+// body is serialized once per isolate and only the user turn is encoded per call
+const SYSTEM_MESSAGE_JSON = JSON.stringify({
+  role: "system",
+  content: ARIA_SYSTEM_PROMPT,
+});
+const CHAT_BODY_PREFIX = `{"model":"google/gemini-2.5-flash","messages":[${SYSTEM_MESSAGE_JSON},`;
+
+Deno.serve(async (req) => {
+  const corsHeaders = getCorsHeaders(req);
 
-serve(async (req) => {
   if (req.method === 'OPTIONS') {
     return new Response(null, { headers: corsHeaders });
   }
 
   try {
-    const LOVABLE_API_KEY = Deno.env.get('LOVABLE_API_KEY');
     if (!LOVABLE_API_KEY) {
       throw new Error('LOVABLE_API_KEY is not configured');
     }
 
+    if (exceedsBodyLimit(req, MAX_BODY_BYTES)) {
+      return jsonResponse({ error: 'Request body too large' }, corsHeaders, 413);
+    }
+
     const { message, fileData, fileType, fileName } = await req.json();
     
     if (!message && !fileData) {
       throw new Error('Message or file is required');
     }
 
-    console.log('Processing chat message:', message);
+    if (message !== undefined && typeof message !== 'string') {
+      return jsonResponse({ error: 'message must be a string' }, corsHeaders, 400);
+    }
+    if (message && message.length > MAX_MESSAGE_LENGTH) {
+      return jsonResponse(
+        { error: `Message is too long (max ${MAX_MESSAGE_LENGTH} characters)` },
+        corsHeaders,
+        400,
+      );
+    }
+
+    log.debug('Processing chat message:', message);
     if (fileData) {
-      console.log('File attached:', fileName, fileType);
+      log.debug('File attached:', fileName, fileType);
     }
 
     // Build message content - can include text and/or image
@@ -69,56 +122,27 @@ serve(async (req) => {
         "Authorization": `Bearer ${LOVABLE_API_KEY}`,
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({
-        model: "google/gemini-2.5-flash",
-        messages: [
-          {
-            role: "system",
-            content: `You are Aria, a friendly and helpful female AI IT Support Agent. You have a warm, sweet, and polite personality.
-
-Key behaviors:
-- Be helpful with any task the user asks - whether it's IT support, analyzing documents, solving exam questions, or any other request
-- When given documents, images, or files, carefully analyze them and help with whatever the user needs
-- If given an exam paper or worksheet, solve the questions step by step with clear explanations
-- Be concise but thorough when explaining solutions
-- Speak naturally like a real person, not like an AI
-- Be patient, understanding, and genuinely caring
-- Use friendly phrases like "I'd be happy to help!", "No worries!", "Let me help you with that"
-- Never mention that you are an AI avatar or any technical implementation details
-- Just be Aria - a friendly helpful assistant
-
-You can help with:
-- Analyzing documents, images, and files
-- Solving exam questions and homework problems
-- Explaining concepts and providing step-by-step solutions
-- IT support and troubleshooting
-- Any other tasks the user needs help with
-
-Always make users feel valued and heard.`
-          },
-          {
-            role: "user",
-            content: userContent
-          }
-        ],
-      }),
+      body: `${CHAT_BODY_PREFIX}${JSON.stringify({ role: 'user', content: userContent })}]}`,
+      signal: AbortSignal.timeout(UPSTREAM_TIMEOUT_MS),
     });
 
     if (!response.ok) {
       const errorText = await response.text();
-      console.error("AI API error:", response.status, errorText);
+      log.error("AI API error:", response.status, errorText);
       
       if (response.status === 429) {
-        return new Response(JSON.stringify({ error: "Rate limit exceeded. Please try again in a moment." }), {
-          status: 429,
-          headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-        });
+        return jsonResponse(
+          { error: "Rate limit exceeded. Please try again in a moment." },
+          corsHeaders,
+          429,
+        );
       }
       if (response.status === 402) {
-        return new Response(JSON.stringify({ error: "AI credits exhausted. Please add funds to continue." }), {
-          status: 402,
-          headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-        });
+        return jsonResponse(
+          { error: "AI credits exhausted. Please add funds to continue." },
+          corsHeaders,
+          402,
+        );
       }
       
       throw new Error(`AI API error: ${response.status}`);
@@ -127,17 +151,12 @@ Always make users feel valued and heard.`
     const data = await response.json();
     const aiResponse = data.choices?.[0]?.message?.content || "I'm sorry, I couldn't process that.";
 
-    console.log("AI response generated");
+    log.debug("AI response generated");
 
-    return new Response(JSON.stringify({ response: aiResponse }), {
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    return jsonResponse({ response: aiResponse }, corsHeaders);
   } catch (err: unknown) {
     const errorMessage = err instanceof Error ? err.message : 'Unknown error';
-    console.error("Error in AI chat:", errorMessage);
-    return new Response(JSON.stringify({ error: errorMessage }), {
-      status: 500,
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    log.error("Error in AI chat:", errorMessage);
+    return jsonResponse({ error: errorMessage }, corsHeaders, errorStatus(err));
   }
 });
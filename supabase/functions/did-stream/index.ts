@@ -1,206 +1,294 @@
-import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
-
-const corsHeaders = {
-  'Access-Control-Allow-Origin': '*',
-  'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type',
-};
+import { getCorsHeaders } from "../_shared/cors.ts";
+import {
+  errorStatus,
+  exceedsBodyLimit,
+  jsonResponse,
+  noContentResponse,
+  rawJsonResponse,
+} from "../_shared/http.ts";
+import { log } from "../_shared/log.ts";
 
 const DID_API_KEY = Deno.env.get('DID_API_KEY');
 const DID_API_URL = 'https://api.d-id.com';
+// Per-operation ceilings on D-ID calls. Creating a stream is the slow one;
+// ICE candidates are tiny and frequent, so they fail fast.
+const DID_TIMEOUT_MS = {
+  createStream: 25_000,
+  submitSdp: 10_000,
+  submitIce: 3_000,
+  speak: 15_000,
+  closeStream: 5_000,
+} as const;
+// Comfortably above the largest legitimate payload (an SDP answer or a long
+// speak script)
+const MAX_BODY_BYTES = 64 * 1024;
+// Matches the client's ICE_BATCH_MAX; each candidate becomes one D-ID call
+const ICE_BATCH_MAX = 16;
 
-serve(async (req) => {
-  if (req.method === 'OPTIONS') {
-    return new Response(null, { headers: corsHeaders });
-  }
+// Constant for the life of the isolate; frozen because it is shared by every
+// concurrent request
+const DID_HEADERS: Readonly<Record<string, string>> = Object.freeze({
+  'Authorization': `Basic ${DID_API_KEY}`,
+  'Content-Type': 'application/json',
+});
+const CREATE_STREAM_BODY = JSON.stringify({ compatibility_mode: 'on', fluent: true });
 
-  try {
-    if (!DID_API_KEY) {
-      throw new Error('DID_API_KEY is not configured');
-    }
+interface IceCandidate {
+  candidate: string;
+  sdpMid?: string | null;
+  sdpMLineIndex?: number | null;
+}
 
-    // Parse body ONCE at the top
-    const body = await req.json();
-    const { action, agentId, streamId, sessionId, text, answer, candidate, sdpMid, sdpMLineIndex } = body;
-    console.log('D-ID action:', action);
+interface DIDStreamRequest {
+  action: string;
+  agentId?: string;
+  streamId?: string;
+  sessionId?: string;
+  text?: string;
+  answer?: string;
+  candidate?: string;
+  sdpMid?: string | null;
+  sdpMLineIndex?: number | null;
+  candidates?: IceCandidate[];
+  endOfCandidates?: boolean;
+}
 
-    const authHeader = `Basic ${DID_API_KEY}`;
+const isIceCandidate = (value: unknown): value is IceCandidate => {
+  if (typeof value !== 'object' || value === null) return false;
+  const { candidate, sdpMid, sdpMLineIndex } = value as Record<string, unknown>;
+  return typeof candidate === 'string' && candidate !== '' &&
+    (sdpMid == null || typeof sdpMid === 'string') &&
+    (sdpMLineIndex == null || typeof sdpMLineIndex === 'number');
+};
 
-    // Create a new stream
-    if (action === 'create-stream') {
-      console.log('Creating D-ID stream for agent:', agentId);
+type ActionHandler = (
+  body: DIDStreamRequest,
+  corsHeaders: Record<string, string>,
+) => Promise<Response>;
 
-      const response = await fetch(`${DID_API_URL}/agents/${agentId}/streams`, {
-        method: 'POST',
-        headers: {
-          'Authorization': authHeader,
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          compatibility_mode: 'on',
-          fluent: true,
-        }),
-      });
+const streamsUrl = (agentId: string | undefined) => `${DID_API_URL}/agents/${agentId}/streams`;
 
-      if (!response.ok) {
-        const errorText = await response.text();
-        console.error('D-ID create stream error:', response.status, errorText);
-        return new Response(
-          JSON.stringify({
-            error: `Failed to create stream`,
-            did_status: response.status,
-            did_body: errorText,
-          }),
-          {
-            status: response.status,
-            headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-          },
-        );
-      }
+// Create a new stream
+const createStream: ActionHandler = async ({ agentId }, corsHeaders) => {
+  log.debug('Creating D-ID stream for agent:', agentId);
 
-      const data = await response.json();
-      console.log('Stream created:', data.id);
-      return new Response(JSON.stringify(data), {
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-      });
-    }
+  const response = await fetch(streamsUrl(agentId), {
+    method: 'POST',
+    headers: DID_HEADERS,
+    body: CREATE_STREAM_BODY,
+    signal: AbortSignal.timeout(DID_TIMEOUT_MS.createStream),
+  });
 
-    // Submit SDP answer
-    if (action === 'submit-sdp') {
-      console.log('Submitting SDP answer for stream:', streamId);
+  if (!response.ok) {
+    const errorText = await response.text();
+    log.error('D-ID create stream error:', response.status, errorText);
+    return jsonResponse(
+      { error: 'Failed to create stream', did_status: response.status, did_body: errorText },
+      corsHeaders,
+      response.status,
+    );
+  }
 
-      const response = await fetch(`${DID_API_URL}/agents/${agentId}/streams/${streamId}/sdp`, {
-        method: 'POST',
-        headers: {
-          'Authorization': authHeader,
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          answer: {
-            type: 'answer',
-            sdp: answer,
-          },
-          session_id: sessionId,
-        }),
-      });
+  log.info('Stream created for agent:', agentId);
 
-      if (!response.ok) {
-        const errorText = await response.text();
-        console.error('D-ID submit SDP error:', response.status, errorText);
-        return new Response(
-          JSON.stringify({
-            error: `Failed to submit SDP`,
-            did_status: response.status,
-            did_body: errorText,
-          }),
-          {
-            status: response.status,
-            headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-          },
-        );
-      }
+  // Forward the upstream JSON as-is rather than parsing and re-encoding it
+  return rawJsonResponse(response.body, corsHeaders);
+};
 
-      return new Response(JSON.stringify({ success: true }), {
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-      });
-    }
+// Submit SDP answer
+const submitSdp: ActionHandler = async ({ agentId, streamId, sessionId, answer }, corsHeaders) => {
+  log.debug('Submitting SDP answer for stream:', streamId);
 
-    // Submit ICE candidate
-    if (action === 'submit-ice') {
-      const iceBody: Record<string, unknown> = { session_id: sessionId };
-      if (candidate) {
-        iceBody.candidate = candidate;
-        iceBody.sdpMid = sdpMid;
-        iceBody.sdpMLineIndex = sdpMLineIndex;
-      }
+  const response = await fetch(`${streamsUrl(agentId)}/${streamId}/sdp`, {
+    method: 'POST',
+    headers: DID_HEADERS,
+    body: JSON.stringify({
+      answer: {
+        type: 'answer',
+        sdp: answer,
+      },
+      session_id: sessionId,
+    }),
+    signal: AbortSignal.timeout(DID_TIMEOUT_MS.submitSdp),
+  });
+
+  if (!response.ok) {
+    const errorText = await response.text();
+    log.error('D-ID submit SDP error:', response.status, errorText);
+    return jsonResponse(
+      { error: 'Failed to submit SDP', did_status: response.status, did_body: errorText },
+      corsHeaders,
+      response.status,
+    );
+  }
+
+  // Drain the body so the keep-alive connection goes back to the pool
+  await response.arrayBuffer();
+  return jsonResponse({ success: true }, corsHeaders);
+};
 
-      const response = await fetch(`${DID_API_URL}/agents/${agentId}/streams/${streamId}/ice`, {
+// Submit ICE candidates. The client batches trickled candidates into
+// `candidates`; a request with no candidate at all (or `endOfCandidates`)
+// signals the end of gathering.
+const submitIce: ActionHandler = async (body, corsHeaders) => {
+  const { agentId, streamId, sessionId, candidate, sdpMid, sdpMLineIndex, candidates, endOfCandidates } = body;
+  const iceUrl = `${streamsUrl(agentId)}/${streamId}/ice`;
+
+  // Don't throw for ICE errors (including timeouts), just log
+  const postIce = async (iceBody: Record<string, unknown>) => {
+    try {
+      const response = await fetch(iceUrl, {
         method: 'POST',
-        headers: {
-          'Authorization': authHeader,
-          'Content-Type': 'application/json',
-        },
+        headers: DID_HEADERS,
         body: JSON.stringify(iceBody),
+        signal: AbortSignal.timeout(DID_TIMEOUT_MS.submitIce),
       });
 
       if (!response.ok) {
         const errorText = await response.text();
-        console.error('D-ID submit ICE error:', response.status, errorText);
-        // Don't throw for ICE errors, just log
+        log.error('D-ID submit ICE error:', response.status, errorText);
+      } else {
+        await response.arrayBuffer();
       }
-
-      return new Response(JSON.stringify({ success: true }), {
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-      });
+    } catch (err: unknown) {
+      log.error('D-ID submit ICE error:', err instanceof Error ? err.message : err);
     }
+  };
 
-    // Speak - make avatar say specific text (uses our own AI for responses)
-    if (action === 'speak') {
-      console.log('Making avatar speak:', text?.substring(0, 50));
+  const batch: IceCandidate[] = Array.isArray(candidates)
+    ? candidates
+    : candidate
+      ? [{ candidate, sdpMid, sdpMLineIndex }]
+      : [];
 
-      const response = await fetch(`${DID_API_URL}/agents/${agentId}/streams/${streamId}`, {
-        method: 'POST',
-        headers: {
-          'Authorization': authHeader,
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          script: {
-            type: 'text',
-            input: text,
-          },
-          session_id: sessionId,
-        }),
-      });
+  // D-ID takes one candidate per call, so fan the batch out concurrently. Each
+  // body is built from the known fields only: a bare { session_id } would be
+  // read as the end-of-candidates signal.
+  await Promise.all(batch.map((c) =>
+    postIce({
+      candidate: c.candidate,
+      sdpMid: c.sdpMid,
+      sdpMLineIndex: c.sdpMLineIndex,
+      session_id: sessionId,
+    })
+  ));
 
-      if (!response.ok) {
-        const errorText = await response.text();
-        console.error('D-ID speak error:', response.status, errorText);
-        return new Response(
-          JSON.stringify({
-            error: `Failed to speak`,
-            did_status: response.status,
-            did_body: errorText,
-          }),
-          {
-            status: response.status,
-            headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-          },
-        );
-      }
+  if (endOfCandidates || (!candidates && !candidate)) {
+    await postIce({ session_id: sessionId });
+  }
 
-      return new Response(JSON.stringify({ success: true }), {
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-      });
+  return noContentResponse(corsHeaders);
+};
+
+// Speak - make avatar say specific text (uses our own AI for responses)
+const speak: ActionHandler = async ({ agentId, streamId, sessionId, text }, corsHeaders) => {
+  log.debug('Making avatar speak:', text?.substring(0, 50));
+
+  const response = await fetch(`${streamsUrl(agentId)}/${streamId}`, {
+    method: 'POST',
+    headers: DID_HEADERS,
+    body: JSON.stringify({
+      script: {
+        type: 'text',
+        input: text,
+      },
+      session_id: sessionId,
+    }),
+    signal: AbortSignal.timeout(DID_TIMEOUT_MS.speak),
+  });
+
+  if (!response.ok) {
+    const errorText = await response.text();
+    log.error('D-ID speak error:', response.status, errorText);
+    return jsonResponse(
+      { error: 'Failed to speak', did_status: response.status, did_body: errorText },
+      corsHeaders,
+      response.status,
+    );
+  }
+
+  await response.arrayBuffer();
+  return jsonResponse({ success: true }, corsHeaders);
+};
+
+// Close stream
+const closeStream: ActionHandler = async ({ agentId, streamId, sessionId }, corsHeaders) => {
+  log.debug('Closing stream:', streamId);
+
+  const response = await fetch(`${streamsUrl(agentId)}/${streamId}`, {
+    method: 'DELETE',
+    headers: DID_HEADERS,
+    body: JSON.stringify({ session_id: sessionId }),
+    signal: AbortSignal.timeout(DID_TIMEOUT_MS.closeStream),
+  });
+  await response.arrayBuffer();
+
+  return noContentResponse(corsHeaders);
+};
+
+// Each action lists the string fields it cannot run without, so malformed
+// requests are rejected before any upstream call is made
+const ACTIONS: Record<string, { handler: ActionHandler; required: readonly (keyof DIDStreamRequest)[] }> = {
+  'create-stream': { handler: createStream, required: ['agentId'] },
+  'submit-sdp': { handler: submitSdp, required: ['agentId', 'streamId', 'sessionId', 'answer'] },
+  'submit-ice': { handler: submitIce, required: ['agentId', 'streamId', 'sessionId'] },
+  'speak': { handler: speak, required: ['agentId', 'streamId', 'sessionId', 'text'] },
+  'close-stream': { handler: closeStream, required: ['agentId', 'streamId', 'sessionId'] },
+};
+
+Deno.serve(async (req) => {
+  const corsHeaders = getCorsHeaders(req);
+
+  if (req.method === 'OPTIONS') {
+    return new Response(null, { headers: corsHeaders });
+  }
+
+  try {
+    if (!DID_API_KEY) {
+      throw new Error('DID_API_KEY is not configured');
     }
 
-    // Close stream
-    if (action === 'close-stream') {
-      console.log('Closing stream:', streamId);
-      
-      await fetch(`${DID_API_URL}/agents/${agentId}/streams/${streamId}`, {
-        method: 'DELETE',
-        headers: {
-          'Authorization': authHeader,
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          session_id: sessionId,
-        }),
-      });
+    if (exceedsBodyLimit(req, MAX_BODY_BYTES)) {
+      return jsonResponse({ error: 'Request body too large' }, corsHeaders, 413);
+    }
 
-      return new Response(JSON.stringify({ success: true }), {
-        headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-      });
+    // Parse body ONCE at the top
+    const body: DIDStreamRequest = await req.json();
+    log.debug('D-ID action:', body?.action);
+
+    const action = Object.hasOwn(ACTIONS, body?.action) ? ACTIONS[body.action] : undefined;
+    if (!action) {
+      return jsonResponse({ error: 'Unknown action: ' + body?.action }, corsHeaders, 400);
     }
 
-    throw new Error('Unknown action: ' + action);
+    const missing = action.required.filter((field) => typeof body[field] !== 'string' || !body[field]);
+    if (missing.length > 0) {
+      return jsonResponse({ error: `Missing or invalid fields: ${missing.join(', ')}` }, corsHeaders, 400);
+    }
+    if (body.candidate !== undefined && typeof body.candidate !== 'string') {
+      return jsonResponse({ error: 'candidate must be a string' }, corsHeaders, 400);
+    }
+    if (body.candidates !== undefined) {
+      if (!Array.isArray(body.candidates) || body.candidates.length > ICE_BATCH_MAX) {
+        return jsonResponse(
+          { error: `candidates must be an array of at most ${ICE_BATCH_MAX} entries` },
+          corsHeaders,
+          400,
+        );
+      }
+      if (!body.candidates.every(isIceCandidate)) {
+        return jsonResponse(
+          { error: 'Each candidate needs a non-empty candidate string and valid sdpMid/sdpMLineIndex' },
+          corsHeaders,
+          400,
+        );
+      }
+    }
 
+    return await action.handler(body, corsHeaders);
   } catch (err: unknown) {
     const errorMessage = err instanceof Error ? err.message : 'Unknown error';
-    console.error('D-ID stream error:', errorMessage);
-    return new Response(JSON.stringify({ error: errorMessage }), {
-      status: 500,
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    log.error('D-ID stream error:', errorMessage);
+    return jsonResponse({ error: errorMessage }, corsHeaders, errorStatus(err));
   }
 });
@@ -1,23 +1,24 @@
-import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
+import { getCorsHeaders } from "../_shared/cors.ts";
+import { errorStatus, jsonResponse, rawJsonResponse } from "../_shared/http.ts";
+import { log } from "../_shared/log.ts";
 
-const corsHeaders = {
-  'Access-Control-Allow-Origin': '*',
-  'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type',
-};
+const HEYGEN_API_KEY = Deno.env.get('HEYGEN_API_KEY');
+const UPSTREAM_TIMEOUT_MS = 10_000;
+
+Deno.serve(async (req) => {
+  const corsHeaders = getCorsHeaders(req);
 
-serve(async (req) => {
   if (req.method === 'OPTIONS') {
     return new Response(null, { headers: corsHeaders });
   }
 
   try {
-    const HEYGEN_API_KEY = Deno.env.get('HEYGEN_API_KEY');
     if (!HEYGEN_API_KEY) {
-      console.error('HEYGEN_API_KEY is not set');
+      log.error('HEYGEN_API_KEY is not set');
       throw new Error('HEYGEN_API_KEY is not configured');
     }
 
-    console.log('Requesting HeyGen access token...');
+    log.debug('Requesting HeyGen access token...');
 
     // Get access token for streaming avatar
     const response = await fetch("https://api.heygen.com/v1/streaming.create_token", {
@@ -26,26 +27,22 @@ serve(async (req) => {
         "Content-Type": "application/json",
         "X-Api-Key": HEYGEN_API_KEY,
       },
+      signal: AbortSignal.timeout(UPSTREAM_TIMEOUT_MS),
     });
 
     if (!response.ok) {
       const errorText = await response.text();
-      console.error("HeyGen API error:", response.status, errorText);
+      log.error("HeyGen API error:", response.status, errorText);
       throw new Error(`HeyGen API error: ${response.status} - ${errorText}`);
     }
 
-    const data = await response.json();
-    console.log("HeyGen token created successfully");
+    log.info("HeyGen token created successfully");
 
-    return new Response(JSON.stringify(data), {
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    // Stream the upstream JSON straight through without buffering it
+    return rawJsonResponse(response.body, corsHeaders);
   } catch (err: unknown) {
     const errorMessage = err instanceof Error ? err.message : 'Unknown error';
-    console.error("Error creating HeyGen token:", errorMessage);
-    return new Response(JSON.stringify({ error: errorMessage }), {
-      status: 500,
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    log.error("Error creating HeyGen token:", errorMessage);
+    return jsonResponse({ error: errorMessage }, corsHeaders, errorStatus(err));
   }
 });
@@ -1,37 +1,10 @@
-import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
-import "https://deno.land/x/xhr@0.1.0/mod.ts";
+import { getCorsHeaders } from "../_shared/cors.ts";
+import { errorStatus, jsonResponse, rawJsonResponse } from "../_shared/http.ts";
+import { log } from "../_shared/log.ts";
 
-const corsHeaders = {
-  'Access-Control-Allow-Origin': '*',
-  'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type',
-};
-
-serve(async (req) => {
-  // Handle CORS preflight requests
-  if (req.method === 'OPTIONS') {
-    return new Response(null, { headers: corsHeaders });
-  }
-
-  try {
-    const OPENAI_API_KEY = Deno.env.get('OPENAI_API_KEY');
-    if (!OPENAI_API_KEY) {
-      console.error('OPENAI_API_KEY is not set');
-      throw new Error('OPENAI_API_KEY is not configured');
-    }
-
-    console.log('Requesting ephemeral token from OpenAI...');
+const OPENAI_API_KEY = Deno.env.get('OPENAI_API_KEY');
 
-    // Request an ephemeral token from OpenAI for WebRTC connection
-    const response = await fetch("https://api.openai.com/v1/realtime/sessions", {
-      method: "POST",
-      headers: {
-        "Authorization": `Bearer ${OPENAI_API_KEY}`,
-        "Content-Type": "application/json",
-      },
-      body: JSON.stringify({
-        model: "gpt-4o-realtime-preview-2024-12-17",
-        voice: "shimmer",
-        instructions: `You are Aria, a professional and adaptive AI IT Support Assistant. You provide high-quality, articulate responses like a knowledgeable expert.
+const ARIA_INSTRUCTIONS = `You are Aria, a professional and adaptive AI IT Support Assistant. You provide high-quality, articulate responses like a knowledgeable expert.
 
 CRITICAL RESPONSE RULES:
 - NEVER repeat what the user said back to them
@@ -66,28 +39,93 @@ PERSONALITY:
 - Encouraging when users make progress
 - Honest about limitations
 
-Focus on being truly helpful rather than just sounding friendly.`
-      }),
-    });
+Focus on being truly helpful rather than just sounding friendly.`;
+
+// The session config never changes, so serialize it once per isolate
+const SESSION_BODY = JSON.stringify({
+  model: "gpt-4o-realtime-preview-2024-12-17",
+  voice: "shimmer",
+  instructions: ARIA_INSTRUCTIONS,
+});
+
+// Ephemeral tokens live for about a minute. Callers arriving close together
+// share one until REUSE_MARGIN_MS before it expires, and concurrent misses
+// wait on the same upstream request instead of each minting their own. The
+// cache lives in isolate memory: the platform runs as many isolates as load
+// needs, and a fresh one simply mints its own token on first use.
+const REUSE_MARGIN_MS = 30_000;
+const UPSTREAM_TIMEOUT_MS = 10_000;
+
+let cachedSession: { body: string; expiresAt: number } | null = null;
+let pendingSession: Promise<string> | null = null;
+
+const mintSession = async (apiKey: string): Promise<string> => {
+  log.debug('Requesting ephemeral token from OpenAI...');
+
+  // Request an ephemeral token from OpenAI for WebRTC connection
+  const response = await fetch("https://api.openai.com/v1/realtime/sessions", {
+    method: "POST",
+    headers: {
+      "Authorization": `Bearer ${apiKey}`,
+      "Content-Type": "application/json",
+    },
+    body: SESSION_BODY,
+    signal: AbortSignal.timeout(UPSTREAM_TIMEOUT_MS),
+  });
 
-    if (!response.ok) {
-      const errorText = await response.text();
-      console.error("OpenAI API error:", response.status, errorText);
-      throw new Error(`OpenAI API error: ${response.status} - ${errorText}`);
+  if (!response.ok) {
+    const errorText = await response.text();
+    log.error("OpenAI API error:", response.status, errorText);
+    throw new Error(`OpenAI API error: ${response.status} - ${errorText}`);
+  }
+
+  // Forward the upstream JSON as-is rather than parsing and re-encoding it
+  const data = await response.text();
+  log.info("Session created successfully");
+
+  const expiresAt = JSON.parse(data).client_secret?.expires_at;
+  if (typeof expiresAt === 'number') {
+    cachedSession = { body: data, expiresAt: expiresAt * 1000 };
+  }
+  return data;
+};
+
+Deno.serve(async (req) => {
+  const corsHeaders = getCorsHeaders(req);
+
+  // Handle CORS preflight requests
+  if (req.method === 'OPTIONS') {
+    return new Response(null, { headers: corsHeaders });
+  }
+
+  try {
+    if (!OPENAI_API_KEY) {
+      log.error('OPENAI_API_KEY is not set');
+      throw new Error('OPENAI_API_KEY is not configured');
+    }
+
+    // Reconnecting clients send { fresh: true }: the cached token may be the one
+    // whose connection just failed, so drop it and mint a new one
+    const { fresh } = await req.json().catch(() => ({}));
+    if (fresh === true) {
+      cachedSession = null;
     }
 
-    const data = await response.json();
-    console.log("Session created successfully");
+    let data: string;
+    if (cachedSession && Date.now() < cachedSession.expiresAt - REUSE_MARGIN_MS) {
+      log.debug('Reusing cached ephemeral token');
+      data = cachedSession.body;
+    } else {
+      pendingSession ??= mintSession(OPENAI_API_KEY).finally(() => {
+        pendingSession = null;
+      });
+      data = await pendingSession;
+    }
 
-    return new Response(JSON.stringify(data), {
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    return rawJsonResponse(data, corsHeaders);
   } catch (error) {
-    console.error("Error creating realtime session:", error);
+    log.error("Error creating realtime session:", error);
     const errorMessage = error instanceof Error ? error.message : 'Unknown error';
-    return new Response(JSON.stringify({ error: errorMessage }), {
-      status: 500,
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    return jsonResponse({ error: errorMessage }, corsHeaders, errorStatus(error));
   }
 });
@@ -1,26 +1,27 @@
-import { serve } from "https://deno.land/std@0.168.0/http/server.ts";
+import { getCorsHeaders } from "../_shared/cors.ts";
+import { errorStatus, jsonResponse, rawJsonResponse } from "../_shared/http.ts";
+import { log } from "../_shared/log.ts";
 
-const corsHeaders = {
-  'Access-Control-Allow-Origin': '*',
-  'Access-Control-Allow-Headers': 'authorization, x-client-info, apikey, content-type',
-};
+const SIMLI_API_KEY = Deno.env.get('SIMLI_API_KEY');
+const UPSTREAM_TIMEOUT_MS = 10_000;
+
+Deno.serve(async (req) => {
+  const corsHeaders = getCorsHeaders(req);
 
-serve(async (req) => {
   // Handle CORS preflight requests
   if (req.method === 'OPTIONS') {
     return new Response(null, { headers: corsHeaders });
   }
 
   try {
-    const SIMLI_API_KEY = Deno.env.get('SIMLI_API_KEY');
     if (!SIMLI_API_KEY) {
-      console.error('SIMLI_API_KEY is not set');
+      log.error('SIMLI_API_KEY is not set');
       throw new Error('SIMLI_API_KEY is not configured');
     }
 
     const { faceId } = await req.json();
     
-    console.log('Creating Simli session for faceId:', faceId);
+    log.debug('Creating Simli session for faceId:', faceId);
 
     // Start an audio-to-video session with Simli
     const response = await fetch("https://api.simli.ai/startAudioToVideoSession", {
@@ -37,26 +38,22 @@ serve(async (req) => {
         syncAudio: true,
         model: "fasttalk",
       }),
+      signal: AbortSignal.timeout(UPSTREAM_TIMEOUT_MS),
     });
 
     if (!response.ok) {
       const errorText = await response.text();
-      console.error('Simli API error:', response.status, errorText);
+      log.error('Simli API error:', response.status, errorText);
       throw new Error(`Simli API error: ${response.status} - ${errorText}`);
     }
 
-    const data = await response.json();
-    console.log("Simli session created:", data);
+    log.info("Simli session created");
 
-    return new Response(JSON.stringify(data), {
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    // Stream the upstream JSON straight through without buffering it
+    return rawJsonResponse(response.body, corsHeaders);
   } catch (err: unknown) {
     const errorMessage = err instanceof Error ? err.message : 'Unknown error';
-    console.error("Error creating Simli session:", errorMessage);
-    return new Response(JSON.stringify({ error: errorMessage }), {
-      status: 500,
-      headers: { ...corsHeaders, 'Content-Type': 'application/json' },
-    });
+    log.error("Error creating Simli session:", errorMessage);
+    return jsonResponse({ error: errorMessage }, corsHeaders, errorStatus(err));
   }
 });